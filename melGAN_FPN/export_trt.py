@@ -0,0 +1,63 @@
+from mel2wav.interface import load_model
+from mel2wav.dataset import AudioDataset
+from mel2wav.modules import Audio2Mel
+from mel2wav.export import export_tensorrt, export_tensorrt_int8
+
+from torch.utils.data import DataLoader, TensorDataset
+from pathlib import Path
+import argparse
+import torch
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--load_path", type=Path, default='logs')
+    parser.add_argument("--save_path", type=Path, default='netG_trt.ts')
+    parser.add_argument("--n_mel_channels", type=int, default=80)
+    parser.add_argument("--int8", action="store_true")
+    parser.add_argument("--data_path", default=None, type=Path)
+    parser.add_argument("--n_calib_samples", type=int, default=256)
+    parser.add_argument("--seq_len", type=int, default=65536)
+    args = parser.parse_args()
+    if args.int8 and args.data_path is None:
+        parser.error("--int8 requires --data_path")
+    return args
+
+
+def calibration_loader(args):
+    """
+    Builds a loader of log-mel spectrograms computed from the training files
+    """
+    dataset = AudioDataset(
+        args.data_path / "train_files.txt",
+        args.seq_len,
+        sampling_rate=22050,
+        augment=False,
+    )
+    fft = Audio2Mel(n_mel_channels=args.n_mel_channels).cuda()
+
+    mels = []
+    with torch.no_grad():
+        for i in range(min(args.n_calib_samples, len(dataset))):
+            mels.append(fft(dataset[i][None].cuda()).squeeze(0))
+
+    return DataLoader(TensorDataset(torch.stack(mels)), batch_size=1)
+
+
+def main():
+    args = parse_args()
+    netG = load_model(args.load_path, device="cuda", fuse=True)
+
+    if args.int8:
+        export_tensorrt_int8(
+            netG,
+            args.save_path,
+            calibration_loader(args),
+            n_mel_channels=args.n_mel_channels,
+        )
+    else:
+        export_tensorrt(netG, args.save_path, n_mel_channels=args.n_mel_channels)
+
+
+if __name__ == "__main__":
+    main()
@@ -12,13 +12,14 @@ def parse_args():
     parser.add_argument("--load_path", type=Path, default='logs')
     parser.add_argument("--save_path", type=Path, default='out')
     parser.add_argument("--folder", type=Path, default='test')
+    parser.add_argument("--compile", action="store_true")
     args = parser.parse_args()
     return args
 
 
 def main():
     args = parse_args()
-    vocoder = MelVocoder(args.load_path)
+    vocoder = MelVocoder(args.load_path, compile_model=args.compile)
 
     args.save_path.mkdir(exist_ok=True, parents=True)
 
@@ -1 +1 @@
-from mel2wav.interface import load_model, MelVocoder
+from mel2wav.interface import load_model, MelVocoder, CUDAGraphGenerator
@@ -0,0 +1,126 @@
+import torch
+import torch.nn as nn
+
+
+class _Int8Generator(nn.Module):
+    def __init__(self, body, head):
+        super().__init__()
+        self.body = body
+        self.head = head
+
+    def forward(self, x):
+        return self.head(self.body(x).float())
+
+
+def _mel_input(torch_tensorrt, n_mel_channels, frames, dtype):
+    min_frames, opt_frames, max_frames = frames
+    return torch_tensorrt.Input(
+        min_shape=(1, n_mel_channels, min_frames),
+        opt_shape=(1, n_mel_channels, opt_frames),
+        max_shape=(1, n_mel_channels, max_frames),
+        dtype=dtype,
+    )
+
+
+def export_tensorrt(
+    netG,
+    save_path,
+    n_mel_channels=80,
+    min_frames=16,
+    opt_frames=256,
+    max_frames=4096,
+):
+    """
+    Compiles the generator ahead of time to a TensorRT FP16 engine and saves it
+    as TorchScript (load it back with torch.jit.load)
+    Args:
+        netG (Generator): generator, ideally already fused with netG.fuse()
+        save_path (str or Path): path of the saved TorchScript module
+        n_mel_channels (int): number of mel channels the generator expects
+        min_frames (int): shortest mel the engine accepts
+        opt_frames (int): mel length the engine is tuned for
+        max_frames (int): longest mel the engine accepts
+    Returns:
+        torch.jit.ScriptModule: TensorRT module taking half precision mels
+    """
+    import torch_tensorrt
+
+    netG = netG.eval().cuda()
+    example_mel = torch.zeros(1, n_mel_channels, opt_frames, device="cuda")
+    with torch.no_grad():
+        traced = torch.jit.trace(netG, example_mel)
+
+    trt_mod = torch_tensorrt.compile(
+        traced,
+        inputs=[
+            _mel_input(
+                torch_tensorrt,
+                n_mel_channels,
+                (min_frames, opt_frames, max_frames),
+                torch.half,
+            )
+        ],
+        enabled_precisions={torch.half},
+    )
+    torch.jit.save(trt_mod, str(save_path))
+    return trt_mod
+
+
+def export_tensorrt_int8(
+    netG,
+    save_path,
+    calib_loader,
+    n_mel_channels=80,
+    min_frames=16,
+    opt_frames=256,
+    max_frames=4096,
+):
+    """
+    Quantizes the generator to INT8 with TensorRT post-training quantization and
+    saves it as TorchScript (load it back with torch.jit.load). The output
+    conv + Tanh is kept out of the engine and runs in FP32 to preserve fidelity
+    Args:
+        netG (Generator): generator, ideally already fused with netG.fuse()
+        save_path (str or Path): path of the saved TorchScript module
+        calib_loader (DataLoader): yields log-mel spectrograms
+            (1, n_mel_channels, timesteps) used for calibration
+        n_mel_channels (int): number of mel channels the generator expects
+        min_frames (int): shortest mel the engine accepts
+        opt_frames (int): mel length the engine is tuned for
+        max_frames (int): longest mel the engine accepts
+    Returns:
+        torch.jit.ScriptModule: quantized generator taking FP32 mels
+    """
+    import torch_tensorrt
+
+    netG = netG.eval().cuda()
+    body, head = netG.model[:-2], netG.model[-2:]
+
+    example_mel = torch.zeros(1, n_mel_channels, opt_frames, device="cuda")
+    with torch.no_grad():
+        traced_body = torch.jit.trace(body, example_mel)
+        traced_head = torch.jit.trace(head, body(example_mel))
+
+    calibrator = torch_tensorrt.ptq.DataLoaderCalibrator(
+        calib_loader,
+        use_cache=False,
+        algo_type=torch_tensorrt.ptq.CalibrationAlgo.ENTROPY_CALIBRATION_2,
+        device=torch.device("cuda"),
+    )
+    trt_body = torch_tensorrt.compile(
+        traced_body,
+        inputs=[
+            _mel_input(
+                torch_tensorrt,
+                n_mel_channels,
+                (min_frames, opt_frames, max_frames),
+                torch.float,
+            )
+        ],
+        enabled_precisions={torch.float, torch.half, torch.int8},
+        calibrator=calibrator,
+    )
+
+    trt_mod = torch.jit.script(_Int8Generator(trt_body, traced_head))
+    torch.jit.save(trt_mod, str(save_path))
+    return trt_mod
@@ -1,4 +1,5 @@
 from mel2wav.modules import Generator, Audio2Mel
+from mel2wav.utils import enable_compile_cache
 
 from pathlib import Path
 import yaml
@@ -13,17 +14,73 @@ def get_default_device():
         return "cpu"
 
 
-def load_model(mel2wav_path, device=get_default_device()):
+def warmup(netG, device, n_mel_channels=80, n_frames=32):
+    """
+    Runs a dummy forward pass so torch.compile pays its compile cost at load
+    time instead of on the first user call. The time dimension is marked dynamic
+    so mels of other lengths reuse the same graph; with mode="reduce-overhead"
+    a CUDA graph is still recorded once per new length
+    Args:
+        netG (Generator): generator to warm up
+        device (str or torch.device): device the generator lives on
+        n_mel_channels (int): number of mel channels the generator expects
+        n_frames (int): number of mel frames of the dummy input
+    """
+    dtype = next(netG.parameters()).dtype
+    mel = torch.zeros(1, n_mel_channels, n_frames, device=device, dtype=dtype)
+    torch._dynamo.mark_dynamic(mel, 2)
+    with torch.no_grad():
+        netG(mel)
+
+
+def load_generator(
+    checkpoint_path,
+    device=get_default_device(),
+    compile_model=False,
+    dtype=torch.float32,
+    fuse=False,
+):
+    """
+    Builds the generator and loads a checkpoint into it
+    Args:
+        checkpoint_path (str or Path): path to the generator state_dict
+        device (str or torch.device): device to load the model
+        compile_model (bool): compile the generator with torch.compile
+        dtype (torch.dtype): inference precision, e.g. torch.bfloat16
+        fuse (bool): fold weight_norm into plain conv weights for inference. The
+            state_dict then holds weight instead of weight_g/weight_v keys and can
+            no longer be loaded into a fresh Generator
+    """
+    if compile_model:
+        enable_compile_cache()
+
+    netG = Generator(80, 32, 3, compile_model=compile_model).to(device)
+    netG.load_state_dict(torch.load(checkpoint_path, map_location=device))
+    if fuse:
+        netG.fuse()
+    netG.to(dtype)
+    if compile_model:
+        warmup(netG, device)
+    return netG
+
+
+def load_model(
+    mel2wav_path,
+    device=get_default_device(),
+    compile_model=False,
+    dtype=torch.float32,
+    fuse=False,
+):
     """
     Args:
         mel2wav_path (str or Path): path to the root folder of dumped text2mel
         device (str or torch.device): device to load the model
+        compile_model (bool): compile the generator with torch.compile
+        dtype (torch.dtype): inference precision, e.g. torch.bfloat16
+        fuse (bool): fold weight_norm for inference (see load_generator)
     """
     root = Path(mel2wav_path)
-    
-    netG = Generator(80, 32, 3).to(device)
-    netG.load_state_dict(torch.load(root / "best_netG.pt", map_location=device))
-    return netG
+    return load_generator(root / "best_netG.pt", device, compile_model, dtype, fuse)
 
 
 class MelVocoder:
@@ -33,18 +90,22 @@ class MelVocoder:
         device=get_default_device(),
         github=False,
         model_name="multi_speaker",
+        compile_model=False,
+        dtype=torch.float32,
     ):
         self.fft = Audio2Mel().to(device)
+        # Only the filterbank matmul runs in dtype, the stft window stays fp32
+        self.fft.mel_basis = self.fft.mel_basis.to(dtype)
         if github:
-            netG = Generator(80, 32, 3).to(device)
             root = Path(os.path.dirname(__file__)).parent
-            netG.load_state_dict(
-                torch.load(root / f"models/{model_name}.pt", map_location=device)
+            self.mel2wav = load_generator(
+                root / f"models/{model_name}.pt", device, compile_model, dtype, fuse=True
             )
-            self.mel2wav = netG
         else:
-            self.mel2wav = load_model(path, device)
+            self.mel2wav = load_model(path, device, compile_model, dtype, fuse=True)
         self.device = device
+        self.dtype = dtype
+        self.compile_model = compile_model
 
     def __call__(self, audio):
         """
@@ -56,6 +117,20 @@ class MelVocoder:
         """
         return self.fft(audio.unsqueeze(1).to(self.device))
 
+    def batch(self, audios):
+        """
+        Performs audio to mel conversion of audios of different lengths in one batch
+        (See Audio2Mel.batch in mel2wav/modules.py)
+        Args:
+            audios (list): 1-D PyTorch tensors containing audio (timesteps,)
+        Returns:
+            torch.tensor: log-mel-spectrograms (len(audios), 80, timesteps)
+            list: number of valid frames of each audio, trim mel[i, :, :n_frames[i]]
+                (or the audio returned by inverse to n_frames[i] * hop_length samples)
+                to drop the padding
+        """
+        return self.fft.batch([a.to(self.device) for a in audios])
+
     def inverse(self, mel):
         """
         Performs mel2audio conversion
@@ -66,4 +141,64 @@ class MelVocoder:
 
         """
         with torch.no_grad():
-            return self.mel2wav(mel.to(self.device)).squeeze(1)
+            mel = mel.to(self.device, self.dtype)
+            audio = self.mel2wav(mel).squeeze(1).float()
+            # reduce-overhead outputs live in CUDA graph memory that the next
+            # call overwrites
+            if self.compile_model:
+                audio = audio.clone()
+            return audio
+
+
+class CUDAGraphGenerator:
+    def __init__(self, netG, chunk_len, n_mel_channels=80, batch_size=1):
+        """
+        Captures a CUDA graph of the generator for a fixed mel chunk shape and
+        replays it per chunk, removing the per-kernel launch overhead
+        Args:
+            netG (Generator): fused generator on a CUDA device. Do not pass a
+                generator built with compile_model, reduce-overhead already
+                captures its own CUDA graphs
+            chunk_len (int): number of mel frames per chunk
+            n_mel_channels (int): number of mel channels the generator expects
+            batch_size (int): number of chunks synthesized together
+        """
+        param = next(netG.parameters())
+        self.static_in = torch.zeros(
+            batch_size, n_mel_channels, chunk_len, device=param.device, dtype=param.dtype
+        )
+
+        # The chunk shape is fixed, so let cuDNN pick the fastest conv algorithms
+        # during warmup; they are then baked into the captured graph. The flag is
+        # process-wide, so it is restored once the graph is captured
+        benchmark = torch.backends.cudnn.benchmark
+        torch.backends.cudnn.benchmark = True
+        try:
+            with torch.no_grad(), torch.cuda.device(param.device):
+                # Warm up on a side stream as required before capture
+                stream = torch.cuda.Stream(param.device)
+                stream.wait_stream(torch.cuda.current_stream())
+                with torch.cuda.stream(stream):
+                    for _ in range(3):
+                        netG(self.static_in)
+                torch.cuda.current_stream().wait_stream(stream)
+
+                self.graph = torch.cuda.CUDAGraph()
+                with torch.cuda.graph(self.graph):
+                    self.static_out = netG(self.static_in)
+        finally:
+            torch.backends.cudnn.benchmark = benchmark
+
+    def __call__(self, mel):
+        """
+        Performs mel2audio conversion of one chunk
+        Args:
+            mel (torch.tensor): log-mel spectrogram chunk with the captured shape
+                (batch_size, n_mel_channels, chunk_len)
+        Returns:
+            torch.tensor: raw audio (batch_size, 1, chunk_len * hop_length)
+        """
+        self.static_in.copy_(mel)
+        self.graph.replay()
+        # static_out is overwritten by the next replay
+        return self.static_out.clone()
@@ -1,23 +1,38 @@
 import torch.nn as nn
 import torch.nn.functional as F
 import torch
+import math
 from librosa.filters import mel as librosa_mel_fn
-from torch.nn.utils import weight_norm
+from torch.nn.utils import weight_norm, remove_weight_norm
+from torch.nn.utils.rnn import pad_sequence
 import numpy as np
 
+try:
+    import mlx.core as mx
+    from mlx_spectro import SpectralTransform
+except ImportError:
+    SpectralTransform = None
+
 
 def count_parameters(model):
         return sum(p.numel() for p in model.parameters() if p.requires_grad)
 
 def weights_init(m):
-    classname = m.__class__.__name__
-    if classname.find("Conv") != -1:
+    if isinstance(m, (nn.Conv1d, nn.ConvTranspose1d, nn.Conv2d)):
         m.weight.data.normal_(0.0, 0.02)
-    elif classname.find("BatchNorm2d") != -1:
+    elif isinstance(m, nn.BatchNorm2d):
         m.weight.data.normal_(1.0, 0.02)
         m.bias.data.fill_(0)
 
 
+def fuse_weight_norm(model):
+    """Folds every weight_norm reparametrization in model into a plain weight"""
+    for m in model.modules():
+        if hasattr(m, "weight_g"):
+            remove_weight_norm(m)
+    return model
+
+
 def WNConv1d(*args, **kwargs):
     return weight_norm(nn.Conv1d(*args, **kwargs))
 
@@ -36,6 +51,7 @@ class Audio2Mel(nn.Module):
         n_mel_channels=80,
         mel_fmin=0.0,
         mel_fmax=None,
+        compile_model=False,
     ):
         super().__init__()
         ##############################################
@@ -53,43 +69,108 @@ class Audio2Mel(nn.Module):
         self.win_length = win_length
         self.sampling_rate = sampling_rate
         self.n_mel_channels = n_mel_channels
+        self.pad_length = (n_fft - hop_length) // 2
+        self.log10_inv = 1.0 / math.log(10.0)
+        self.mlx_transform = None
+
+        # dynamic=True since audio length varies between calls
+        if compile_model:
+            self.compile(dynamic=True)
 
     def forward(self, audio):
-        p = (self.n_fft - self.hop_length) // 2
-        audio = F.pad(audio, (p, p), "reflect").squeeze(1)
+        p = self.pad_length
+        audio = F.pad(audio.float(), (p, p), "reflect").squeeze(1)
+        return self.log_mel(audio)
+
+    def batch(self, audios):
+        """
+        Runs audios of different lengths as one batch, so the stft and the
+        filterbank matmul are single calls. Each audio is reflect padded on its
+        own and then zero padded to the longest, so its first n_frames frames
+        match a separate call; the frames after that are padding
+        Args:
+            audios (list): 1-D audio tensors
+        Returns:
+            torch.tensor: log-mel-spectrograms (len(audios), n_mel_channels, timesteps)
+            list: number of valid frames of each audio
+        """
+        p = self.pad_length
+        padded = [F.pad(a.reshape(1, -1).float(), (p, p), "reflect")[0] for a in audios]
+        n_frames = [(a.size(-1) - self.n_fft) // self.hop_length + 1 for a in padded]
+        return self.log_mel(pad_sequence(padded, batch_first=True)), n_frames
+
+    def log_mel(self, audio):
+        # stft and log stay in fp32, the filterbank matmul runs in the dtype of
+        # mel_basis (e.g. after casting only mel_basis to torch.bfloat16)
+        magnitude = self.stft_magnitude(audio).to(self.mel_basis.dtype)
+        mel_output = torch.matmul(self.mel_basis, magnitude).float()
+        log_mel_spec = torch.log(torch.clamp(mel_output, min=1e-5)) * self.log10_inv
+        return log_mel_spec
+
+    def stft_magnitude(self, audio):
+        # torch.stft is slow on the MPS backend, use the fused Metal kernels of
+        # mlx-spectro there when it is installed and no gradient is needed
+        if (
+            SpectralTransform is not None
+            and audio.device.type == "mps"
+            and not audio.requires_grad
+        ):
+            if self.mlx_transform is None:
+                self.mlx_transform = SpectralTransform(
+                    n_fft=self.n_fft,
+                    hop_length=self.hop_length,
+                    win_length=self.win_length,
+                    window_fn="hann",
+                    center=False,
+                )
+            fft = self.mlx_transform.stft(
+                mx.array(audio.cpu().numpy()), output_layout="bfn"
+            )
+            return torch.from_numpy(np.array(mx.abs(fft))).to(audio.device)
+
         fft = torch.stft(
             audio,
             n_fft=self.n_fft,
             hop_length=self.hop_length,
             win_length=self.win_length,
-            window=self.window,
+            window=self.window.float(),
             center=False,
+            return_complex=True,
         )
-        real_part, imag_part = fft.unbind(-1)
-        magnitude = torch.sqrt(real_part ** 2 + imag_part ** 2)
-        mel_output = torch.matmul(self.mel_basis, magnitude)
-        log_mel_spec = torch.log10(torch.clamp(mel_output, min=1e-5))
-        return log_mel_spec
+        return fft.abs()
 
 
 class ResnetBlock(nn.Module):
     def __init__(self, dim, dilation=1):
         super().__init__()
+        # Explicit pad layers are kept on purpose: Conv1d(padding_mode="reflect")
+        # still pads in a separate F.pad call and would shift the Sequential
+        # indices that the released checkpoints are keyed on
         self.block = nn.Sequential(
             nn.LeakyReLU(0.2),
             nn.ReflectionPad1d(dilation),
             WNConv1d(dim, dim, kernel_size=3, dilation=dilation),
-            nn.LeakyReLU(0.2),
+            nn.LeakyReLU(0.2, True),
             WNConv1d(dim, dim, kernel_size=1),
         )
         self.shortcut = WNConv1d(dim, dim, kernel_size=1)
 
     def forward(self, x):
-        return self.shortcut(x) + self.block(x)
+        # The shortcut output is a fresh tensor nothing else reads, sum into it
+        out = self.shortcut(x)
+        out.add_(self.block(x))
+        return out
 
 
 class Generator(nn.Module):
-    def __init__(self, input_size, ngf, n_residual_layers):
+    def __init__(
+        self,
+        input_size,
+        ngf,
+        n_residual_layers,
+        compile_model=False,
+        compile_mode="reduce-overhead",
+    ):
         super().__init__()
         ratios = [8, 8, 2, 2]
         self.hop_length = np.prod(ratios)
@@ -101,9 +182,11 @@ class Generator(nn.Module):
         ]
 
         # Upsample to raw audio scale
+        # The activations between stages only ever see a fresh conv/residual output,
+        # so they can run in place without an extra feature map per stage
         for i, r in enumerate(ratios):
             model += [
-                nn.LeakyReLU(0.2),
+                nn.LeakyReLU(0.2, True),
                 WNConvTranspose1d(
                     mult * ngf,
                     mult * ngf // 2,
@@ -120,7 +203,7 @@ class Generator(nn.Module):
             mult //= 2
 
         model += [
-            nn.LeakyReLU(0.2),
+            nn.LeakyReLU(0.2, True),
             nn.ReflectionPad1d(3),
             WNConv1d(ngf, 1, kernel_size=7, padding=0),
             nn.Tanh(),
@@ -129,6 +212,14 @@ class Generator(nn.Module):
         self.model = nn.Sequential(*model)
         self.apply(weights_init)
 
+        # Compiled in place so the state_dict keys (and checkpoints) are unchanged.
+        # Compilation itself is lazy and happens on the first forward.
+        if compile_model:
+            self.model.compile(mode=compile_mode, fullgraph=True)
+
+    def fuse(self):
+        return fuse_weight_norm(self)
+
     def forward(self, x):
         return self.model(x)
 
@@ -237,40 +328,24 @@ class NLayerDiscriminator(nn.Module):
         #print(k.shape)
         return k 
 
-    def forward(self, x):
-        bottom_up = []
-        top_down = []
-        # bottom - up
-        
-        for key, layer in self.model.items():
-            #print('x의 before은 : ',x.shape)
-            x = layer(x)
-            #print('x의 after은 : ',x.shape)
-            bottom_up.append(x)
-            
-        #print('----------------------------')
-
-        
-
-        result = self.top(bottom_up[4]) + self.latlayer_128(bottom_up[3])
-        top_down.append(result)
-        
-        result = self.top(result) + self.latlayer_64(bottom_up[2])
-        top_down.append(result)
-        
-        result = self.top(result) + self.latlayer_32(bottom_up[1])
-        top_down.append(result)
+    def fuse(self):
+        return fuse_weight_norm(self)
 
-        result = self.top(result) + self.latlayer_16(bottom_up[0])
-        top_down.append(result)
+    def forward(self, x):
+        # bottom - up, only the first five levels feed the pyramid
+        c0 = self.model["layer_0"](x)
+        c1 = self.model["layer_1"](c0)
+        c2 = self.model["layer_2"](c1)
+        c3 = self.model["layer_3"](c2)
+        c4 = self.model["layer_4"](c3)
 
-        result = self.final(result)    
-        top_down.append(result)    
-        
-        #for i in range(len(top_down)):
-            #print(top_down[i].shape)
+        # top - down
+        p3 = self.top(c4) + self.latlayer_128(c3)
+        p2 = self.top(p3) + self.latlayer_64(c2)
+        p1 = self.top(p2) + self.latlayer_32(c1)
+        p0 = self.top(p1) + self.latlayer_16(c0)
 
-        return top_down
+        return p3, p2, p1, p0, self.final(p0)
 
 
 class Discriminator(nn.Module):
@@ -283,18 +358,21 @@ class Discriminator(nn.Module):
                 ndf, n_layers, downsampling_factor
             )
 
+        # Kept as a single AvgPool1d kernel: a depthwise averaging conv only pays
+        # off when fused under torch.compile, and netD is not compiled
         self.downsample = nn.AvgPool1d(4, stride=2, padding=1, count_include_pad=False)
         self.apply(weights_init)
 
-        self.p_num = 0
-    
+        self.p_num = count_parameters(self.model)
 
     def forward(self, x):
+        # The scales are not batched into one forward: every disc_i has its own
+        # weights, and padding the shorter scales to a common length would change
+        # their edge outputs
         results = []
-        self.p_num = count_parameters(self.model)
-        for key, disc in self.model.items():
-            
+        for i, disc in enumerate(self.model.values()):
             results.append(disc(x))
-            x = self.downsample(x)
-            
+            if i < len(self.model) - 1:
+                x = self.downsample(x)
+
         return results
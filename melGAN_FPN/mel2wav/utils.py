@@ -1,5 +1,8 @@
 import scipy.io.wavfile
 
+from pathlib import Path
+import os
+
 
 def save_sample(file_path, sampling_rate, audio):
     """Helper function to save sample
@@ -11,3 +14,23 @@ def save_sample(file_path, sampling_rate, audio):
     """
     audio = (audio.numpy() * 32768).astype("int16")
     scipy.io.wavfile.write(file_path, sampling_rate, audio)
+
+
+def enable_compile_cache(cache_dir=None):
+    """Enables the TorchInductor FX graph cache so compiled graphs are reused
+    across processes instead of being recompiled on every launch
+
+    Args:
+        cache_dir (str or pathlib.Path): persistent cache directory, defaults to
+            ~/.cache/mel2wav/inductor. Ignored if TORCHINDUCTOR_CACHE_DIR is
+            already set
+    """
+    import torch._inductor.config
+
+    if cache_dir is None:
+        cache_dir = Path.home() / ".cache" / "mel2wav" / "inductor"
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(cache_dir))
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    torch._inductor.config.fx_graph_cache = (
+        os.environ["TORCHINDUCTOR_FX_GRAPH_CACHE"] == "1"
+    )
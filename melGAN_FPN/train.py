@@ -1,6 +1,6 @@
 from mel2wav.dataset import AudioDataset
 from mel2wav.modules import Generator, Discriminator, Audio2Mel
-from mel2wav.utils import save_sample
+from mel2wav.utils import save_sample, enable_compile_cache
 
 import torch
 import torch.nn.functional as F
@@ -29,6 +29,8 @@ def parse_args():
     parser.add_argument("--downsamp_factor", type=int, default=2)
     parser.add_argument("--lambda_feat", type=float, default=10)
     parser.add_argument("--cond_disc", action="store_true")
+    parser.add_argument("--compile", action="store_true")
+    parser.add_argument("--amp", action="store_true")
 
     parser.add_argument("--data_path", default=None, type=Path)
     parser.add_argument("--batch_size", type=int, default=16)
@@ -59,11 +61,21 @@ def main():
     #######################
     # Load PyTorch Models #
     #######################
-    netG = Generator(args.n_mel_channels, args.ngf, args.n_residual_layers).cuda()
+    if args.compile:
+        enable_compile_cache()
+    netG = Generator(
+        args.n_mel_channels,
+        args.ngf,
+        args.n_residual_layers,
+        compile_model=args.compile,
+        compile_mode="default",
+    ).cuda()
     netD = Discriminator(
         args.num_D, args.ndf, args.n_layers_D, args.downsamp_factor
     ).cuda()
-    fft = Audio2Mel(n_mel_channels=args.n_mel_channels).cuda()
+    fft = Audio2Mel(
+        n_mel_channels=args.n_mel_channels, compile_model=args.compile
+    ).cuda()
 
     #print(netG)
     #print(netD)
@@ -119,7 +131,8 @@ def main():
     costs = []
     start = time.time()
 
-    # enable cudnn autotuner to speed up training
+    # enable cudnn autotuner to speed up training, every batch has the same
+    # (batch_size, seq_len) shape so it is tuned once, any new shape re-tunes
     torch.backends.cudnn.benchmark = True
 
     best_mel_reconst = 1000000
@@ -128,7 +141,8 @@ def main():
         for iterno, x_t in enumerate(train_loader):
             x_t = x_t.cuda()
             s_t = fft(x_t).detach()
-            x_pred_t = netG(s_t.cuda())
+            with torch.amp.autocast("cuda", dtype=torch.bfloat16, enabled=args.amp):
+                x_pred_t = netG(s_t.cuda())
 
             with torch.no_grad():
                 s_pred_t = fft(x_pred_t.detach())
@@ -137,15 +151,17 @@ def main():
             #######################
             # Train Discriminator #
             #######################
-            D_fake_det = netD(x_pred_t.cuda().detach())
-            D_real = netD(x_t.cuda())
+            with torch.amp.autocast("cuda", dtype=torch.bfloat16, enabled=args.amp):
+                D_fake_det = netD(x_pred_t.cuda().detach())
+                D_real = netD(x_t.cuda())
 
+            # losses are computed in fp32, the D outputs are bf16 under --amp
             loss_D = 0
             for scale in D_fake_det:
-                loss_D += F.relu(1 + scale[-1]).mean()
+                loss_D += F.relu(1 + scale[-1].float()).mean()
 
             for scale in D_real:
-                loss_D += F.relu(1 - scale[-1]).mean()
+                loss_D += F.relu(1 - scale[-1].float()).mean()
 
             netD.zero_grad()
             loss_D.backward()
@@ -154,11 +170,12 @@ def main():
             ###################
             # Train Generator #
             ###################
-            D_fake = netD(x_pred_t.cuda())
+            with torch.amp.autocast("cuda", dtype=torch.bfloat16, enabled=args.amp):
+                D_fake = netD(x_pred_t.cuda())
 
             loss_G = 0
             for scale in D_fake:
-                loss_G += -scale[-1].mean()
+                loss_G += -scale[-1].float().mean()
 
             loss_feat = 0
             feat_weights = 4.0 / (args.n_layers_D + 1)
@@ -166,7 +183,9 @@ def main():
             wt = D_weights * feat_weights
             for i in range(args.num_D):
                 for j in range(len(D_fake[i]) - 1):
-                    loss_feat += wt * F.l1_loss(D_fake[i][j], D_real[i][j].detach())
+                    loss_feat += wt * F.l1_loss(
+                        D_fake[i][j].float(), D_real[i][j].float().detach()
+                    )
 
             netG.zero_grad()
             (loss_G + args.lambda_feat * loss_feat).backward()